@@ -0,0 +1,132 @@
+"""Compare the wall-clock time of scoring a corpus with a long-tailed
+distribution of sentence lengths with naive chunking (contiguous chunks
+with the same number of lines, one per worker) and with the cost-balanced
+batches of `teapot.scheduling.Scheduler`
+
+By default this uses a scorer that sleeps for a time proportional to the
+length of its inputs on the thread backend, so that the effect of the
+scheduling can be measured even on a single core. Use `--scorer chrf` (and
+several cores) to time an actual scorer.
+
+Usage: python benchmarks/balanced_batches.py [--workers 4] [--scorer sleep]
+"""
+import os.path
+import time
+import random
+import argparse
+from concurrent import futures
+
+import sys
+teapot_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(teapot_root)
+from teapot import scorers  # noqa
+from teapot import scheduling  # noqa
+
+
+class Sleep(scorers.Scorer):
+    """Simulates a scorer whose cost is proportional to the input length
+    (eg. a model running outside of the python interpreter)"""
+    _name = "sleep"
+    thread_safe = True
+    releases_gil = True
+
+    def __init__(self, seconds_per_char=1e-6):
+        self.seconds_per_char = seconds_per_char
+
+    def score_corpus(self, hyps, refs, lang=None):
+        cost = sum(self.cost(hyp, ref) for hyp, ref in zip(hyps, refs))
+        time.sleep(self.seconds_per_char * cost)
+        return [float(hyp == ref) for hyp, ref in zip(hyps, refs)]
+
+
+def get_args():
+    parser = argparse.ArgumentParser("Balanced batches benchmark")
+    parser.add_argument("--scorer", default="sleep", type=str)
+    parser.add_argument("--workers", default=4, type=int)
+    parser.add_argument("--backend", default="thread", type=str)
+    parser.add_argument("--n-sentences", default=20000, type=int)
+    parser.add_argument("--repeats", default=3, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    return parser.parse_args()
+
+
+def synthetic_corpus(n_sentences, rng):
+    """Mostly tweet length sentences with a long tail of documents"""
+    vocab = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz")
+                for _ in range(rng.randint(2, 8)))
+        for _ in range(5000)
+    ]
+    hyps, refs = [], []
+    for _ in range(n_sentences):
+        length = min(int(rng.paretovariate(1.2) * 5), 400)
+        ref = [rng.choice(vocab) for _ in range(length)]
+        # Perturb about 20% of the words
+        hyp = [rng.choice(vocab) if rng.random() < 0.2 else word
+               for word in ref]
+        hyps.append(" ".join(hyp))
+        refs.append(" ".join(ref))
+    return hyps, refs
+
+
+def naive_chunks(scorer, hyps, refs, workers, backend):
+    """One contiguous chunk with the same number of lines per worker"""
+    if backend == "thread":
+        executor = futures.ThreadPoolExecutor(workers)
+    else:
+        executor = futures.ProcessPoolExecutor(workers)
+    chunk_size = -(-len(hyps) // workers)
+    with executor:
+        chunks = executor.map(
+            scorer.score_corpus,
+            [hyps[i:i + chunk_size] for i in range(0, len(hyps), chunk_size)],
+            [refs[i:i + chunk_size] for i in range(0, len(refs), chunk_size)],
+        )
+        return [score for chunk in chunks for score in chunk]
+
+
+def balanced_batches(scorer, hyps, refs, workers, backend):
+    with scheduling.Scheduler(workers=workers, backend=backend) as sched:
+        return list(scorer.score(hyps, refs, check_tok=False, scheduler=sched))
+
+
+def main():
+    args = get_args()
+    rng = random.Random(args.seed)
+    hyps, refs = synthetic_corpus(args.n_sentences, rng)
+    # The long sentences are clustered at the end of the corpus, as can
+    # happen when concatenating datasets
+    order = sorted(range(len(hyps)), key=lambda idx: len(refs[idx]))
+    hyps = [hyps[idx] for idx in order]
+    refs = [refs[idx] for idx in order]
+    lengths = sorted(len(ref.split()) for ref in refs)
+    print(
+        f"{len(refs)} sentences, length median: {lengths[len(lengths)//2]}, "
+        f"99%: {lengths[int(len(lengths)*0.99)]}, max: {lengths[-1]}"
+    )
+    if args.scorer == "sleep":
+        scorer = Sleep()
+    else:
+        scorer = scorers.get_scorer_class(args.scorer)()
+    reference_scores = None
+    for name, run in [
+        ("naive chunks", naive_chunks),
+        ("balanced batches", balanced_batches),
+    ]:
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            scores = run(scorer, hyps, refs, args.workers, args.backend)
+            times.append(time.perf_counter() - start)
+        if reference_scores is None:
+            reference_scores = scores
+        elif scores != reference_scores:
+            raise ValueError(f"Scores differ with {name}")
+        print(
+            f"{name}:\tbest {min(times):.3f}s\t"
+            f"mean {sum(times)/len(times):.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
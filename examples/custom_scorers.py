@@ -13,6 +13,13 @@ import teapot
 @teapot.register_scorer("f1", "F-1")
 # Then subclass `teapot.Scorer`
 class F1(teapot.Scorer):
+    # You can optionally declare what your scorer supports, which lets
+    # teapot schedule the work better when running with `--workers`
+    # (see `teapot.Scorer` for the full list). This scorer can safely be
+    # called from several threads, and its output only depends on its
+    # inputs.
+    thread_safe = True
+    pure = True
 
     def score_sentence(self, hyp, ref, lang=None):
         """Score the similarity between 2 sentences
@@ -58,5 +58,8 @@ setup(
     install_requires=[
         "sacrebleu>=1.3.1",
     ],
+    extras_require={
+        "numpy": ["numpy"],
+    },
     include_package_data=True,
 )
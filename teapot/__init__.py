@@ -2,7 +2,7 @@ from teapot.scorers import Scorer, register_scorer
 from teapot.scorers import BLEU, METEOR, ChrF, ZeroOne
 
 
-__version__ = "0.2.2"
+__version__ = "0.3.0"
 
 __all__ = [
     "Scorer",
@@ -0,0 +1,182 @@
+import os
+import json
+import struct
+from array import array
+from teapot import utils
+
+# File layout:
+#  - magic string
+#  - header: uint32 length followed by a JSON blob (the run fingerprint)
+#  - records, each made of:
+#      uint16 key length, key (utf8), uint64 offset, uint32 count,
+#      followed by `count` little endian doubles
+_MAGIC = b"TEAPOTCK"
+_HEADER = struct.Struct("<I")
+_KEY = struct.Struct("<H")
+_RECORD = struct.Struct("<QI")
+
+
+class Checkpoint(object):
+    """Append-only record of the per-line scores computed so far
+
+    Scores are stored by key (eg. "s_src") along with the offset of the
+    first line they correspond to, so that an interrupted run can pick up
+    exactly where it stopped. The fingerprint identifies the run (input
+    files, scorers...) and is checked when resuming.
+
+    An existing checkpoint is never overwritten unless `overwrite` is
+    True."""
+
+    def __init__(
+        self,
+        path,
+        fingerprint,
+        every=10000,
+        resume=False,
+        overwrite=False,
+    ):
+        if every < 1:
+            raise ValueError(
+                f"Checkpoint frequency must be positive (got {every})"
+            )
+        self.path = path
+        self.fingerprint = fingerprint
+        self.every = every
+        # Number of scores saved for each key (the scores themselves are
+        # only kept in the file)
+        self._counts = {}
+        if resume and os.path.isfile(path):
+            end = self._read()
+            # Drop any partially written record
+            self._file = open(path, "r+b")
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            if (
+                not overwrite and
+                os.path.isfile(path) and
+                os.path.getsize(path) > 0
+            ):
+                raise ValueError(
+                    f"Checkpoint \"{path}\" already exists, resume from it "
+                    "or explicitly overwrite it (with `--resume` or "
+                    "`--overwrite-checkpoint` on the command line)"
+                )
+            self._file = open(path, "wb")
+            self._write_header()
+
+    def _write_header(self):
+        header = json.dumps(self.fingerprint, sort_keys=True).encode("utf8")
+        self._file.write(_MAGIC)
+        self._file.write(_HEADER.pack(len(header)))
+        self._file.write(header)
+        self._sync()
+
+    def _read_header(self, f):
+        """Read the fingerprint at the start of the file"""
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"\"{self.path}\" is not a TEAPOT checkpoint")
+        try:
+            (header_len,) = _HEADER.unpack(f.read(_HEADER.size))
+            header = f.read(header_len)
+            if len(header) < header_len:
+                raise ValueError("Truncated header")
+            return json.loads(header.decode("utf8"))
+        except (struct.error, ValueError):
+            # (this includes JSON and unicode decoding errors)
+            raise ValueError(f"\"{self.path}\" is not a TEAPOT checkpoint")
+
+    def _records(self, f):
+        """Iterate over the complete records, as (key, offset, count). The
+        file is positioned at the start of the scores of each record, and
+        at the end of the last complete record once the iteration stops"""
+        size = os.fstat(f.fileno()).st_size
+        while True:
+            start = f.tell()
+            key_len_bytes = f.read(_KEY.size)
+            if len(key_len_bytes) < _KEY.size:
+                break
+            (key_len,) = _KEY.unpack(key_len_bytes)
+            key_bytes = f.read(key_len)
+            record = f.read(_RECORD.size)
+            if len(record) < _RECORD.size:
+                break
+            offset, count = _RECORD.unpack(record)
+            if f.tell() + 8 * count > size:
+                break
+            scores_start = f.tell()
+            yield key_bytes.decode("utf8"), offset, count
+            f.seek(scores_start + 8 * count)
+        f.seek(start)
+
+    def _read(self):
+        """Check all complete records, return the offset of the end of the
+        last one"""
+        with open(self.path, "rb") as f:
+            fingerprint = self._read_header(f)
+            if fingerprint != json.loads(json.dumps(self.fingerprint)):
+                raise ValueError(
+                    f"Checkpoint \"{self.path}\" was created by a different "
+                    "run (input files or options changed), refusing to "
+                    "resume"
+                )
+            for key, offset, count in self._records(f):
+                done = self._counts.get(key, 0)
+                if offset != done:
+                    raise ValueError(
+                        f"Corrupted checkpoint \"{self.path}\": expected "
+                        f"scores for \"{key}\" starting at line {done}, "
+                        f"found line {offset}"
+                    )
+                self._counts[key] = done + count
+            return f.tell()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def load(self, key):
+        """Scores already computed for `key` (read from the file)"""
+        scores = array("d")
+        if self._counts.get(key, 0) == 0:
+            return scores
+        with open(self.path, "rb") as f:
+            self._read_header(f)
+            for record_key, _, count in self._records(f):
+                if record_key == key:
+                    scores.fromfile(f, count)
+        return utils.little_endian(scores)
+
+    def append(self, key, offset, scores):
+        """Record the scores for lines `offset` to `offset + len(scores)`"""
+        done = self._counts.get(key, 0)
+        if offset != done:
+            raise ValueError(
+                f"Scores for \"{key}\" should be checkpointed in order "
+                f"(expected line {done}, got {offset})"
+            )
+        key_bytes = key.encode("utf8")
+        self._file.write(_KEY.pack(len(key_bytes)))
+        self._file.write(key_bytes)
+        self._file.write(_RECORD.pack(offset, len(scores)))
+        values = utils.little_endian(utils.as_scores(scores, "array"))
+        self._file.write(values.tobytes())
+        self._sync()
+        self._counts[key] = done + len(scores)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def fingerprint_file(filename):
+    """Cheap identifier for an input file (path, size and mtime)"""
+    if filename is None:
+        return None
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
@@ -1,11 +1,40 @@
+import sys
 import os.path
 import argparse
 from teapot import scorers
 from teapot import utils
+from teapot import checkpoint
+from teapot import scheduling
+from teapot import results
+
+# Input files (these are fingerprinted when checkpointing)
+FILE_ARGS = ["src", "adv_src", "ref", "out", "adv_out"]
+# Arguments that don't affect the value of the per-line scores
+NON_SCORING_ARGS = [
+    "scale",
+    "success_threshold",
+    "terse",
+    "checkpoint",
+    "checkpoint_every",
+    "resume",
+    "overwrite_checkpoint",
+    "workers",
+    "backend",
+    "deduplicate",
+    "save_results",
+    "index_top_k",
+    "index_bins",
+    "score_type",
+]
 
 
 def get_args():
-    parser = argparse.ArgumentParser("TEAPOT", conflict_handler="resolve")
+    parser = argparse.ArgumentParser(
+        "TEAPOT",
+        conflict_handler="resolve",
+        epilog="Results saved with `--save-results FILE` can be explored "
+        "with `teapot query FILE` (see `teapot query --help`).",
+    )
     parser.add_argument(
         "--s-src",
         default="chrf",
@@ -96,6 +125,101 @@ def get_args():
         default=[],
         help="Path to python files containing custom scorers implementation"
     )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        type=str,
+        metavar="FILE",
+        help="Periodically save the scores computed so far to this file, "
+        "so that the run can be resumed with `--resume` if interrupted.",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        default=10000,
+        type=int,
+        metavar="N",
+        help="Save a checkpoint every N lines.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the file specified with `--checkpoint` (if it "
+        "exists) instead of starting from scratch.",
+    )
+    parser.add_argument(
+        "--overwrite-checkpoint",
+        action="store_true",
+        help="Start from scratch even if the file specified with "
+        "`--checkpoint` already exists (its content will be lost).",
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="Number of parallel workers used for scoring. Whether threads "
+        "or processes are used depends on the scorer (see `--backend`).",
+    )
+    parser.add_argument(
+        "--backend",
+        default="auto",
+        type=str,
+        choices=scheduling.BACKENDS,
+        help="How to run the workers. By default this is decided based on "
+        "the capabilities of each scorer.",
+    )
+    parser.add_argument(
+        "--deduplicate",
+        action="store_true",
+        help="Only score duplicate pairs of sentences once (for scorers that "
+        "support it). This uses more memory.",
+    )
+    parser.add_argument(
+        "--score-type",
+        default="array",
+        type=str,
+        choices=utils.SCORE_TYPES,
+        help="How per-line scores are stored in memory. `array` (default) "
+        "uses 8 bytes per score, `float32` uses 4 bytes per score but "
+        "requires numpy (as does `float64`).",
+    )
+    parser.add_argument(
+        "--save-results",
+        default=None,
+        type=str,
+        metavar="FILE",
+        help="Save the per-line scores to this file, along with an index "
+        "that can be queried with `teapot query FILE`.",
+    )
+    parser.add_argument(
+        "--index-top-k",
+        default=100,
+        type=int,
+        help="Number of highest and lowest scores to store in the index "
+        "of the saved results.",
+    )
+    parser.add_argument(
+        "--index-bins",
+        default=20,
+        type=int,
+        help="Number of histogram bins to store in the index of the saved "
+        "results.",
+    )
+    parser.add_argument(
+        "--matrix",
+        nargs="+",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Instead of evaluating an attack, score each of these (aligned) "
+        "files against every other with the target side score (`--s-tgt` "
+        "and `--tgt-lang`) and print the matrix of average scores.",
+    )
+    parser.add_argument(
+        "--matrix-symmetric",
+        action="store_true",
+        help="Assume that the score is symmetric and only compute the upper "
+        "triangular part of the matrix.",
+    )
 
     args, _ = parser.parse_known_args()
     # Check arguments
@@ -104,12 +228,44 @@ def get_args():
         args.out is not None and
         args.adv_out is not None
     )
-    if not (source_side or target_side):
+    if args.matrix is not None:
+        for name in FILE_ARGS + [
+            "checkpoint",
+            "resume",
+            "overwrite_checkpoint",
+            "save_results",
+        ]:
+            if getattr(args, name):
+                option = "--" + name.replace("_", "-")
+                raise ValueError(
+                    f"`{option}` can't be used with `--matrix`"
+                )
+        for filename in args.matrix:
+            if not os.path.isfile(filename):
+                raise ValueError(
+                    f"Specified file for \"matrix\" (\"{filename}\")"
+                    " does not exist"
+                )
+    elif not (source_side or target_side):
         raise ValueError(
             "You need to specify at least `--src` and `--adv-src` "
             "(for source side evaluation) OR `--out` and `--adv-out` "
             " (for target side evaluation)."
         )
+    if args.resume and args.checkpoint is None:
+        raise ValueError("`--resume` requires a `--checkpoint` file")
+    if args.resume and args.overwrite_checkpoint:
+        raise ValueError(
+            "`--resume` and `--overwrite-checkpoint` are mutually exclusive"
+        )
+    if args.index_top_k < 0:
+        raise ValueError(
+            f"`--index-top-k` can't be negative (got {args.index_top_k})"
+        )
+    if args.index_bins < 1:
+        raise ValueError(
+            f"`--index-bins` must be positive (got {args.index_bins})"
+        )
     with_references = False
     if args.ref is not None:
         with_references = True
@@ -143,9 +299,179 @@ def get_args():
     return args, source_side, target_side, with_references
 
 
+def run_fingerprint(args):
+    """Identify the inputs and options that determine the scores of a run"""
+    fingerprint = {}
+    for name, value in vars(args).items():
+        if name in NON_SCORING_ARGS:
+            continue
+        if name in FILE_ARGS:
+            value = checkpoint.fingerprint_file(value)
+        fingerprint[name] = value
+    return fingerprint
+
+
+def scheduler_from_args(args):
+    if args.workers > 1 or args.backend != "auto" or args.deduplicate:
+        return scheduling.Scheduler(
+            workers=args.workers,
+            backend=args.backend,
+            deduplicate=args.deduplicate,
+        )
+    return None
+
+
+def main_matrix(args):
+    scale = args.scale
+    scorer = scorers.get_scorer_class(args.s_tgt).from_args(args)
+    scheduler = scheduler_from_args(args)
+    # Read each file once
+    corpora = [utils.loadtxt(filename) for filename in args.matrix]
+    matrix = scorer.score_matrix(
+        corpora,
+        lang=args.tgt_lang,
+        symmetric=args.matrix_symmetric,
+        scheduler=scheduler,
+        score_type=args.score_type,
+    )
+    if scheduler is not None:
+        scheduler.close()
+    means = [[utils.mean(scores) if len(scores) > 0 else 0
+              for scores in row]
+             for row in matrix]
+    # Print the matrix
+    if args.terse:
+        for row in means:
+            print("\t".join(f"{mean*scale:.3f}" for mean in row))
+    else:
+        print(
+            f"Pairwise {scorer.name} "
+            "(row: hypothesis, column: reference):"
+        )
+        labels = [f"[{i}]" for i in range(len(args.matrix))]
+        print("\t" + "\t".join(labels))
+        for label, row in zip(labels, means):
+            print(label + "\t" + "\t".join(f"{m*scale:.3f}" for m in row))
+        print("-" * 80)
+        for label, filename in zip(labels, args.matrix):
+            print(f"{label}\t{filename}")
+
+
+def get_query_args(argv):
+    parser = argparse.ArgumentParser(
+        "TEAPOT query",
+        description="Query results saved with `--save-results`",
+    )
+    parser.add_argument(
+        "results",
+        type=str,
+        help="Results file",
+    )
+    parser.add_argument(
+        "--column",
+        default=None,
+        type=str,
+        help="Which score to query (eg. s_src, d_tgt, s_tgt or success). "
+        "Defaults to the first column.",
+    )
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument(
+        "--top-k",
+        default=None,
+        type=int,
+        metavar="K",
+        help="Show the K lines with the highest scores",
+    )
+    query.add_argument(
+        "--bottom-k",
+        default=None,
+        type=int,
+        metavar="K",
+        help="Show the K lines with the lowest scores",
+    )
+    query.add_argument(
+        "--above",
+        default=None,
+        type=float,
+        help="Show all lines with a score above this value",
+    )
+    query.add_argument(
+        "--below",
+        default=None,
+        type=float,
+        help="Show all lines with a score below this value",
+    )
+    query.add_argument(
+        "--histogram",
+        action="store_true",
+        help="Show the histogram of the scores",
+    )
+    parser.add_argument(
+        "--scale",
+        default=100,
+        type=float,
+        help="Scale for the scores (thresholds are in the same scale).",
+    )
+    parser.add_argument(
+        "--show",
+        action="store_true",
+        help="Also print the sentences for each selected line (they are read "
+        "from the files used to compute the results).",
+    )
+    return parser.parse_args(argv)
+
+
+def main_query(argv):
+    args = get_query_args(argv)
+    scale = args.scale
+    saved = results.Results(args.results)
+    column = args.column or saved.columns[0]
+    # Histogram
+    if args.histogram:
+        hist = saved.histogram(column)
+        if hist is None:
+            return
+        edges, counts = hist["edges"], hist["counts"]
+        max_count = max(counts)
+        for low, high, count in zip(edges[:-1], edges[1:], counts):
+            bar = "#" * round(40 * count / max(max_count, 1))
+            print(f"{low*scale:.3f}-{high*scale:.3f}\t{count}\t{bar}")
+        return
+    # Select lines
+    if args.top_k is not None:
+        selected = saved.top_k(column, args.top_k, largest=True)
+    elif args.bottom_k is not None:
+        selected = saved.top_k(column, args.bottom_k, largest=False)
+    elif args.above is not None:
+        selected = saved.threshold(column, above=args.above / scale)
+    else:
+        selected = saved.threshold(column, below=args.below / scale)
+    if not args.show:
+        print(f"Line\t{column}")
+        for line, score in selected:
+            print(f"{line+1}\t{score*scale:.3f}")
+        return
+    # Print the sentences as well
+    selected = list(selected)
+    files = saved.metadata.get("files", {})
+    texts = {
+        name: results.select_lines(filename, [line for line, _ in selected])
+        for name, filename in files.items()
+    }
+    for line, score in selected:
+        print(f"Line {line+1}\t{column}: {score*scale:.3f}")
+        for name in files:
+            print(f"  {name}:\t{texts[name][line]}")
+
+
 def main():
+    # Subcommands
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        return main_query(sys.argv[2:])
     # Command line args
     args, source_side, target_side, with_references = get_args()
+    if args.matrix is not None:
+        return main_matrix(args)
     scale = args.scale
     if not with_references:
         print(
@@ -154,6 +480,20 @@ def main():
         )
     # Scorer
     scorer_src, scorer_tgt = scorers.scorers_from_args(args)
+    # Scheduler
+    scheduler = scheduler_from_args(args)
+    # Checkpoint
+    ckpt = None
+    if args.checkpoint is not None:
+        ckpt = checkpoint.Checkpoint(
+            args.checkpoint,
+            run_fingerprint(args),
+            every=args.checkpoint_every,
+            resume=args.resume,
+            overwrite=args.overwrite_checkpoint,
+        )
+    # Per-line results
+    columns = {}
     # Source side eval
     N = None
     if source_side:
@@ -162,7 +502,12 @@ def main():
             utils.loadtxt(args.adv_src),
             utils.loadtxt(args.src),
             lang=args.src_lang,
+            checkpoint=ckpt,
+            key="s_src",
+            scheduler=scheduler,
+            score_type=args.score_type,
         )
+        columns["s_src"] = s_src
         # statistics
         N = len(s_src)
         s_src_avg, s_src_std, s_src_5, s_src_95 = utils.stats(s_src)
@@ -183,7 +528,12 @@ def main():
             utils.loadtxt(args.out),
             utils.loadtxt(args.ref),
             lang=args.tgt_lang,
+            checkpoint=ckpt,
+            key="d_tgt",
+            scheduler=scheduler,
+            score_type=args.score_type,
         )
+        columns["d_tgt"] = d_tgt
         # Check size
         if N is None:
             N = len(d_tgt)
@@ -209,11 +559,11 @@ def main():
             print(f"5%-95%:\t{d_tgt_5*scale:.3f}-{d_tgt_95*scale:.3f}")
     # Both sided (success) with references
     if target_side and source_side and with_references:
-        success = [
-            float(s + d > args.success_threshold)
-            for s, d in zip(s_src, d_tgt)
-        ]
-        success_fraction = sum(success) / N
+        success = utils.attack_success(
+            s_src, d_tgt, args.success_threshold
+        )
+        columns["success"] = success
+        success_fraction = utils.mean(success)
         # Print success
         if args.terse:
             print(f"{success_fraction*100:.3f}")
@@ -228,7 +578,12 @@ def main():
             utils.loadtxt(args.adv_out),
             utils.loadtxt(args.out),
             lang=args.tgt_lang,
+            checkpoint=ckpt,
+            key="s_tgt",
+            scheduler=scheduler,
+            score_type=args.score_type,
         )
+        columns["s_tgt"] = d_tgt
         # Check size
         if N is None:
             N = len(d_tgt)
@@ -254,11 +609,11 @@ def main():
 
     # Both sided (success) and without references
     if target_side and source_side and not with_references:
-        success = [
-            float(s/d > args.success_threshold)
-            for s, d in zip(s_src, d_tgt)
-        ]
-        success_fraction = sum(success) / N
+        success = utils.refless_attack_success(
+            s_src, d_tgt, args.success_threshold
+        )
+        columns["success"] = success
+        success_fraction = utils.mean(success)
         # Print success
         if args.terse:
             print(f"{success_fraction*100:.3f}")
@@ -266,6 +621,30 @@ def main():
             print("-" * 80)
             print(f"Success percentage: {success_fraction*100:.2f} %")
 
+    # Save per-line results
+    if args.save_results is not None:
+        files = {
+            name: os.path.abspath(getattr(args, name))
+            for name in FILE_ARGS
+            if getattr(args, name) is not None
+        }
+        results.save_results(
+            args.save_results,
+            columns,
+            metadata={
+                "files": files,
+                "s_src": scorer_src.name,
+                "s_tgt": scorer_tgt.name,
+            },
+            top_k=args.index_top_k,
+            n_bins=args.index_bins,
+        )
+
+    if ckpt is not None:
+        ckpt.close()
+    if scheduler is not None:
+        scheduler.close()
+
 
 if __name__ == "__main__":
     main()
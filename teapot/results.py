@@ -0,0 +1,182 @@
+import os.path
+import json
+import heapq
+import struct
+from array import array
+from teapot import utils
+
+# File layout:
+#  - magic string
+#  - header: uint64 length followed by a JSON blob (number of lines, column
+#    names, metadata and index)
+#  - the scores of each column, one after the other, as little endian
+#    doubles
+_MAGIC = b"TEAPOTRS"
+_HEADER = struct.Struct("<Q")
+# Number of scores read at once when streaming a column
+_CHUNK_SIZE = 1 << 16
+
+
+def _histogram(scores, n_bins):
+    low, high = min(scores), max(scores)
+    width = (high - low) / n_bins
+    counts = [0] * n_bins
+    for score in scores:
+        if width > 0:
+            counts[min(int((score - low) / width), n_bins - 1)] += 1
+        else:
+            counts[0] += 1
+    edges = [low + i * width for i in range(n_bins)] + [high]
+    return {"edges": edges, "counts": counts}
+
+
+def _check_index_options(top_k, n_bins):
+    if top_k < 0:
+        raise ValueError(f"top_k can't be negative (got {top_k})")
+    if n_bins < 1:
+        raise ValueError(
+            f"The number of bins must be positive (got {n_bins})"
+        )
+
+
+def build_index(scores, top_k=100, n_bins=20):
+    """Top-k highest and lowest scores (with their line number) and
+    histogram of the scores"""
+    _check_index_options(top_k, n_bins)
+    if len(scores) == 0:
+        return {"top": [], "bottom": [], "hist": None}
+    return {
+        "top": heapq.nlargest(
+            top_k, enumerate(scores), key=lambda x: x[1]
+        ),
+        "bottom": heapq.nsmallest(
+            top_k, enumerate(scores), key=lambda x: x[1]
+        ),
+        "hist": _histogram(scores, n_bins),
+    }
+
+
+def save_results(filename, columns, metadata=None, top_k=100, n_bins=20):
+    """Save per-line scores along with an index for fast queries
+
+    `columns` is a dictionary mapping names (eg. "s_src") to the list of
+    scores for each line."""
+    _check_index_options(top_k, n_bins)
+    columns = {
+        name: utils.as_scores(scores, "array")
+        for name, scores in columns.items()
+    }
+    lengths = set(len(scores) for scores in columns.values())
+    if len(lengths) > 1:
+        raise ValueError(
+            f"All columns should have the same length (got {lengths})"
+        )
+    header = {
+        "n_lines": lengths.pop() if lengths else 0,
+        "columns": list(columns),
+        "metadata": metadata or {},
+        "index": {
+            name: build_index(scores, top_k=top_k, n_bins=n_bins)
+            for name, scores in columns.items()
+        },
+    }
+    header_bytes = json.dumps(header).encode("utf8")
+    with open(filename, "wb") as f:
+        f.write(_MAGIC)
+        f.write(_HEADER.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for values in columns.values():
+            utils.little_endian(values).tofile(f)
+
+
+class Results(object):
+    """Read-only access to results saved with `save_results`
+
+    Only the header is loaded in memory, scores are streamed from the file
+    when a query can't be answered from the index."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(
+                    f"\"{filename}\" is not a TEAPOT results file"
+                )
+            (header_len,) = _HEADER.unpack(f.read(_HEADER.size))
+            header = json.loads(f.read(header_len).decode("utf8"))
+        self._data_start = len(_MAGIC) + _HEADER.size + header_len
+        self.n_lines = header["n_lines"]
+        self.columns = header["columns"]
+        self.metadata = header["metadata"]
+        self.index = header["index"]
+
+    def _check_column(self, column):
+        if column not in self.columns:
+            raise ValueError(
+                f"Unknown column \"{column}\" "
+                f"(choose from: {', '.join(self.columns)})"
+            )
+
+    def iter_column(self, column):
+        """Iterate over (line number, score), reading the file by chunks"""
+        self._check_column(column)
+        column_start = self.columns.index(column) * self.n_lines
+        with open(self.filename, "rb") as f:
+            f.seek(self._data_start + 8 * column_start)
+            line = 0
+            while line < self.n_lines:
+                values = array("d")
+                values.fromfile(f, min(_CHUNK_SIZE, self.n_lines - line))
+                for score in utils.little_endian(values):
+                    yield line, score
+                    line += 1
+
+    def top_k(self, column, k, largest=True):
+        """The k highest (or lowest) scores with their line number"""
+        self._check_column(column)
+        if k < 1:
+            raise ValueError(f"k must be positive (got {k})")
+        indexed = self.index[column]["top" if largest else "bottom"]
+        if k <= len(indexed) or len(indexed) == self.n_lines:
+            return [tuple(x) for x in indexed[:k]]
+        # Not in the index: use a heap over the whole column
+        select = heapq.nlargest if largest else heapq.nsmallest
+        return select(k, self.iter_column(column), key=lambda x: x[1])
+
+    def threshold(self, column, above=None, below=None):
+        """Iterate over the lines with a score strictly above `above` and/or
+        strictly below `below`"""
+        for line, score in self.iter_column(column):
+            if above is not None and score <= above:
+                continue
+            if below is not None and score >= below:
+                continue
+            yield line, score
+
+    def histogram(self, column):
+        """Bin edges and counts"""
+        self._check_column(column)
+        return self.index[column]["hist"]
+
+
+def select_lines(filename, line_numbers):
+    """Read only the lines at the given (0-based) line numbers"""
+    line_numbers = set(line_numbers)
+    lines = {}
+    if len(line_numbers) == 0:
+        return lines
+    if not os.path.isfile(filename):
+        raise ValueError(f"Can't find \"{filename}\"")
+    n_lines = 0
+    for line_number, line in enumerate(utils.itertxt(filename)):
+        n_lines += 1
+        if line_number in line_numbers:
+            lines[line_number] = line
+            if len(lines) == len(line_numbers):
+                break
+    if len(lines) < len(line_numbers):
+        raise ValueError(
+            f"\"{filename}\" only has {n_lines} lines, it was probably "
+            "modified after the results were saved"
+        )
+    return lines
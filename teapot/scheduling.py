@@ -0,0 +1,242 @@
+import time
+import pickle
+import weakref
+from array import array
+from concurrent import futures
+from teapot import scorers
+from teapot import utils
+
+BACKENDS = ["auto", "serial", "thread", "process"]
+
+
+def _score_batch(scorer, hyps, refs, lang):
+    """Score one batch and measure how long it took (this is run by the
+    workers)"""
+    start = time.perf_counter()
+    scores = scorer.score_corpus(hyps, refs, lang=lang)
+    if len(scores) != len(hyps):
+        raise ValueError(
+            f"{scorer.name} returned {len(scores)} scores for a batch of "
+            f"{len(hyps)} sentences"
+        )
+    return scores, time.perf_counter() - start
+
+
+def _score_range(scorer, hyps, refs, start, stop, lang):
+    """Same as `_score_batch` on lines `start` to `stop`. The slices are
+    only created once the batch runs (for workers sharing memory)"""
+    return _score_batch(scorer, hyps[start:stop], refs[start:stop], lang)
+
+
+class Scheduler(object):
+    """Split the scoring work in batches and dispatch it to workers
+
+    The size of the batches is adapted to the measured throughput of each
+    scorer, so that every batch takes about `batch_seconds` to score. The
+    cost of a batch is estimated with `Scorer.cost`, and its size is kept
+    within the `min_batch_size`/`max_batch_size` hints of the scorer.
+
+    Batches are scored with threads or processes depending on the
+    capabilities declared by the scorer (see `Scorer.thread_safe`,
+    `Scorer.process_safe` and `Scorer.releases_gil`), unless a specific
+    backend is requested.
+
+    Because batches are cut by cost rather than by number of sentences,
+    workers get a similar amount of work even when sentence lengths vary a
+    lot (see `benchmarks/balanced_batches.py`).
+
+    If `deduplicate` is True, duplicate (hyp, ref) pairs are only scored
+    once for scorers that declare themselves as `pure`.
+
+    `mp_context` is the multiprocessing context used to start worker
+    processes (the platform default if None)."""
+
+    def __init__(
+        self,
+        workers=1,
+        backend="auto",
+        batch_seconds=1.0,
+        deduplicate=False,
+        mp_context=None,
+    ):
+        if workers < 1:
+            raise ValueError(
+                f"The number of workers must be positive (got {workers})"
+            )
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown backend \"{backend}\" "
+                f"(choose from: {', '.join(BACKENDS)})"
+            )
+        self.workers = workers
+        self.backend = backend
+        self.batch_seconds = batch_seconds
+        self.deduplicate = deduplicate
+        self.mp_context = mp_context
+        # Measured seconds per unit of cost, for each scorer
+        self._seconds_per_cost = weakref.WeakKeyDictionary()
+        # Whether each scorer can be pickled
+        self._picklable = weakref.WeakKeyDictionary()
+        self._executors = {}
+
+    def _can_use_processes(self, scorer):
+        """Whether the scorer declares itself process safe and can actually
+        be sent to other processes"""
+        if not scorer.process_safe:
+            return False
+        if scorer not in self._picklable:
+            try:
+                pickle.dumps(scorer)
+                self._picklable[scorer] = True
+            except Exception:
+                self._picklable[scorer] = False
+        return self._picklable[scorer]
+
+    def backend_for(self, scorer):
+        """Pick a backend to run `scorer` with"""
+        if self.backend == "auto":
+            if self.workers == 1:
+                return "serial"
+            elif scorer.releases_gil and scorer.thread_safe:
+                return "thread"
+            elif self._can_use_processes(scorer):
+                return "process"
+            elif scorer.thread_safe:
+                return "thread"
+            else:
+                return "serial"
+        if self.backend == "thread" and not scorer.thread_safe:
+            raise ValueError(f"{scorer.name} scorer is not thread safe")
+        if self.backend == "process" and not self._can_use_processes(scorer):
+            raise ValueError(
+                f"{scorer.name} scorer can't be run in separate processes"
+            )
+        return self.backend
+
+    def _executor(self, backend):
+        if backend not in self._executors:
+            if backend == "thread":
+                executor = futures.ThreadPoolExecutor(self.workers)
+            else:
+                # Custom scorers need to be loaded in the worker processes
+                executor = futures.ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=self.mp_context,
+                    initializer=scorers.load_custom_sources,
+                    initargs=(dict(scorers.custom_sources),),
+                )
+            self._executors[backend] = executor
+        return self._executors[backend]
+
+    def budget(self, scorer, mean_cost):
+        """Total cost of the next batch"""
+        seconds_per_cost = self._seconds_per_cost.get(scorer)
+        if seconds_per_cost is None:
+            # No measurement yet: trust the scorer
+            return scorer.batch_size * mean_cost
+        return self.batch_seconds / max(seconds_per_cost, 1e-12)
+
+    def next_batch(self, scorer, hyps, refs, start, budget):
+        """Cut the next batch, starting at `start`. Returns the end of the
+        batch and its total cost (costs are computed on the fly so that
+        they don't need to be stored for every line)"""
+        max_size = len(hyps) - start
+        if scorer.max_batch_size is not None:
+            max_size = min(max_size, scorer.max_batch_size)
+        min_size = min(scorer.min_batch_size, max_size)
+        size, total = 0, 0
+        while size < max_size and (size < min_size or total < budget):
+            total += scorer.cost(hyps[start + size], refs[start + size])
+            size += 1
+        return start + size, total
+
+    def _update(self, scorer, cost, elapsed):
+        """Update the throughput estimate for this scorer"""
+        if cost <= 0:
+            return
+        measured = elapsed / cost
+        previous = self._seconds_per_cost.get(scorer)
+        if previous is None:
+            self._seconds_per_cost[scorer] = measured
+        else:
+            self._seconds_per_cost[scorer] = (previous + measured) / 2
+
+    def score(self, scorer, hyps, refs, lang=None):
+        """Score all pairs with `scorer.score_corpus`, in batches"""
+        if self.deduplicate and scorer.pure:
+            # Only score unique pairs
+            unique, inverse = {}, array("q")
+            for pair in zip(hyps, refs):
+                inverse.append(unique.setdefault(pair, len(unique)))
+            hyps = [hyp for hyp, _ in unique]
+            refs = [ref for _, ref in unique]
+            del unique
+            scores = self._score(scorer, hyps, refs, lang)
+            return array("d", (scores[idx] for idx in inverse))
+        return self._score(scorer, hyps, refs, lang)
+
+    def _score(self, scorer, hyps, refs, lang):
+        backend = self.backend_for(scorer)
+        total_cost = sum(
+            scorer.cost(hyp, ref) for hyp, ref in zip(hyps, refs)
+        )
+        mean_cost = total_cost / max(len(hyps), 1)
+        scores = array("d", [0.0]) * len(hyps)
+        if backend == "serial":
+            start = 0
+            while start < len(hyps):
+                budget = self.budget(scorer, mean_cost)
+                stop, cost = self.next_batch(scorer, hyps, refs, start, budget)
+                batch_scores, elapsed = _score_range(
+                    scorer, hyps, refs, start, stop, lang
+                )
+                self._update(scorer, cost, elapsed)
+                scores[start:stop] = utils.as_scores(batch_scores, "array")
+                start = stop
+            return scores
+        executor = self._executor(backend)
+        # Make sure that there is enough batches for all workers
+        max_budget = total_cost / self.workers
+        pending = {}
+        start = 0
+        while start < len(hyps) or pending:
+            # Keep all workers busy
+            while start < len(hyps) and len(pending) < 2 * self.workers:
+                budget = min(self.budget(scorer, mean_cost), max_budget)
+                stop, cost = self.next_batch(scorer, hyps, refs, start, budget)
+                if backend == "thread":
+                    future = executor.submit(
+                        _score_range, scorer, hyps, refs, start, stop, lang
+                    )
+                else:
+                    future = executor.submit(
+                        _score_batch,
+                        scorer,
+                        hyps[start:stop],
+                        refs[start:stop],
+                        lang,
+                    )
+                pending[future] = (start, stop, cost)
+                start = stop
+            done, _ = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED
+            )
+            for future in done:
+                batch_start, batch_stop, cost = pending.pop(future)
+                batch_scores, elapsed = future.result()
+                self._update(scorer, cost, elapsed)
+                scores[batch_start:batch_stop] = utils.as_scores(
+                    batch_scores, "array"
+                )
+        return scores
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown()
+        self._executors = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,12 +1,18 @@
+import sys
+import os.path
 import tempfile
 import subprocess
 import importlib.util
 
 import re
+from array import array
 import sacrebleu
 from teapot import utils
 
 scorers = {}
+# Custom scorers source files loaded so far
+# (module name -> (path, source code))
+custom_sources = {}
 
 
 def register_scorer(keys, name):
@@ -29,13 +35,56 @@ def register_scorer(keys, name):
 
 class Scorer(object):
     _name = "base"
+    # Capabilities, used by `teapot.scheduling.Scheduler` to split and
+    # dispatch the work. Subclasses should override them as appropriate.
+    # Preferred number of sentences per call to `score_corpus` (this is
+    # only used until the actual throughput has been measured)
+    batch_size = 1000
+    # Bounds on the number of sentences per call to `score_corpus`
+    min_batch_size = 1
+    max_batch_size = None
+    # Whether `score_corpus` can be called from several threads at once
+    thread_safe = False
+    # Whether the scorer can be pickled and run in other processes
+    process_safe = False
+    # Whether most of the work is done outside of the python interpreter
+    # (eg. in a subprocess), in which case threads are preferred
+    releases_gil = False
+    # Whether the score only depends on (hyp, ref, lang), in which case
+    # duplicate pairs only need to be scored once
+    pure = False
 
     @property
     def name(self):
         return self._name
 
-    def score(self, hyps, refs, lang=None, check_tok=True):
-        """Score a list of hypotheses"""
+    def cost(self, hyp, ref):
+        """Relative cost of scoring a pair of sentences"""
+        return len(hyp) + len(ref) + 1
+
+    def score(
+        self,
+        hyps,
+        refs,
+        lang=None,
+        check_tok=True,
+        checkpoint=None,
+        key="score",
+        scheduler=None,
+        score_type="array",
+    ):
+        """Score a list of hypotheses
+
+        The scores are returned as a `score_type` container (see
+        `teapot.utils.SCORE_TYPES`). By default this is a compact
+        `array.array("d")`, which behaves like a list of floats.
+
+        If a `teapot.checkpoint.Checkpoint` is provided, the scores are
+        computed by chunks and saved under `key` as they are completed.
+        Scores already present in the checkpoint are not recomputed.
+
+        If a `teapot.scheduling.Scheduler` is provided, it is used to split
+        the work in batches and run them in parallel."""
         if len(hyps) != len(refs):
             raise ValueError(
                 "Mismatched input lengths "
@@ -44,25 +93,133 @@ class Scorer(object):
         if check_tok:
             utils.check_tokenization(hyps)
             utils.check_tokenization(refs)
-        return self.score_corpus(hyps, refs, lang=lang)
-
-    def rd_score(self, hyps, bases, refs, lang=None, check_tok=True):
+        if checkpoint is None:
+            return utils.as_scores(
+                self._schedule(hyps, refs, lang, scheduler),
+                score_type,
+            )
+        scores = checkpoint.load(key)
+        for start in range(len(scores), len(hyps), checkpoint.every):
+            stop = start + checkpoint.every
+            chunk_scores = self._schedule(
+                hyps[start:stop],
+                refs[start:stop],
+                lang,
+                scheduler,
+            )
+            checkpoint.append(key, start, chunk_scores)
+            scores.extend(chunk_scores)
+        return utils.as_scores(scores, score_type)
+
+    def rd_score(
+        self,
+        hyps,
+        bases,
+        refs,
+        lang=None,
+        check_tok=True,
+        checkpoint=None,
+        key="rd_score",
+        scheduler=None,
+        score_type="array",
+    ):
         """Relative decrease in score"""
         if check_tok:
             utils.check_tokenization(hyps)
             utils.check_tokenization(bases)
             utils.check_tokenization(refs)
-        base_scores = self.score(bases, refs, lang=lang, check_tok=False)
-        hyp_scores = self.score(hyps, refs, lang=lang, check_tok=False)
-        rd_scores = [
-            utils.relative_decrease(base_score, hyp_score)
-            for base_score, hyp_score in zip(base_scores, hyp_scores)
-        ]
-        return rd_scores
+        base_scores = self.score(
+            bases,
+            refs,
+            lang=lang,
+            check_tok=False,
+            checkpoint=checkpoint,
+            key=f"{key}/base",
+            scheduler=scheduler,
+            score_type=score_type,
+        )
+        hyp_scores = self.score(
+            hyps,
+            refs,
+            lang=lang,
+            check_tok=False,
+            checkpoint=checkpoint,
+            key=f"{key}/hyp",
+            scheduler=scheduler,
+            score_type=score_type,
+        )
+        return utils.relative_decrease(base_scores, hyp_scores)
+
+    def score_matrix(
+        self,
+        corpora,
+        lang=None,
+        check_tok=True,
+        symmetric=False,
+        scheduler=None,
+        score_type="array",
+    ):
+        """Score every corpus against every other corpus
+
+        `corpora` is a list of K aligned lists of sentences. This returns a
+        K x K matrix (list of lists) where element `[i][j]` contains the
+        per-line scores of `corpora[i]` (hypothesis) w.r.t. `corpora[j]`
+        (reference). If a scheduler is provided, all pairs are scored in a
+        single pass so that it can parallelize across pairs.
+
+        If `symmetric` is True, the score is assumed to be symmetric and
+        only the upper triangular part (including the diagonal) is
+        computed, `[j][i]` is then the same list as `[i][j]`."""
+        if len(corpora) < 1:
+            raise ValueError("You need to specify at least one corpus")
+        N = len(corpora[0])
+        for corpus in corpora:
+            if len(corpus) != N:
+                raise ValueError(
+                    "Mismatched input lengths "
+                    f"{len(corpus)}!={N}"
+                )
+        if check_tok:
+            for corpus in corpora:
+                utils.check_tokenization(corpus)
+        K = len(corpora)
+        pairs = [(i, j) for i in range(K) for j in range(K)
+                 if not symmetric or i <= j]
+        matrix = [[None] * K for _ in range(K)]
+        if scheduler is None:
+            # Score pair by pair
+            for i, j in pairs:
+                matrix[i][j] = utils.as_scores(
+                    self.score_corpus(corpora[i], corpora[j], lang=lang),
+                    score_type,
+                )
+        else:
+            # Concatenate all pairs
+            hyps, refs = [], []
+            for i, j in pairs:
+                hyps.extend(corpora[i])
+                refs.extend(corpora[j])
+            scores = utils.as_scores(
+                scheduler.score(self, hyps, refs, lang=lang),
+                score_type,
+            )
+            del hyps, refs
+            # Split the scores back
+            for pair_idx, (i, j) in enumerate(pairs):
+                matrix[i][j] = scores[pair_idx * N:(pair_idx + 1) * N]
+        if symmetric:
+            for i, j in pairs:
+                matrix[j][i] = matrix[i][j]
+        return matrix
+
+    def _schedule(self, hyps, refs, lang, scheduler):
+        if scheduler is None:
+            return self.score_corpus(hyps, refs, lang=lang)
+        return scheduler.score(self, hyps, refs, lang=lang)
 
     def score_corpus(self, hyps, refs, lang=None):
-        return [self.score_sentence(hyp, ref, lang=lang)
-                for hyp, ref in zip(hyps, refs)]
+        return array("d", (self.score_sentence(hyp, ref, lang=lang)
+                           for hyp, ref in zip(hyps, refs)))
 
     def score_sentence(self, hyp, ref, lang=None):
         raise NotImplementedError()
@@ -78,6 +235,10 @@ class Scorer(object):
 
 @register_scorer(["zero_one", "exact_match"], "accuracy")
 class ZeroOne(Scorer):
+    batch_size = 100000
+    thread_safe = True
+    process_safe = True
+    pure = True
 
     def score_sentence(self, hyp, ref, lang=None):
         return float(hyp == ref)
@@ -85,6 +246,9 @@ class ZeroOne(Scorer):
 
 @register_scorer("bleu", "BLEU")
 class BLEU(Scorer):
+    thread_safe = True
+    process_safe = True
+    pure = True
 
     def score_sentence(self, hyp, ref, lang=None):
         return sacrebleu.sentence_bleu(hyp, [ref], smooth_value=0.01, smooth_method="floor").score / 100
@@ -92,6 +256,9 @@ class BLEU(Scorer):
 
 @register_scorer("chrf", "ChrF")
 class ChrF(Scorer):
+    thread_safe = True
+    process_safe = True
+    pure = True
 
     def score_sentence(self, hyp, ref, lang=None):
         return sacrebleu.sentence_chrf(hyp, [ref]).score / 100
@@ -99,6 +266,13 @@ class ChrF(Scorer):
 
 @register_scorer("meteor", "METEOR")
 class METEOR(Scorer):
+    # Starting the JVM is expensive so we want as few calls as possible
+    batch_size = 100000
+    min_batch_size = 10000
+    thread_safe = True
+    process_safe = True
+    releases_gil = True
+    pure = True
 
     def __init__(self, meteor_jar, java_command="java -Xmx2G -jar"):
         self.meteor_jar = meteor_jar
@@ -174,11 +348,46 @@ class METEOR(Scorer):
         return cls(args.meteor_jar, java_command=args.java_command)
 
 
-def read_custom_scorers_source(source_path):
+def _load_source(module_name, source_path, source):
     # Adapted from https://stackoverflow.com/a/67692
-    spec = importlib.util.spec_from_file_location("module.name", source_path)
-    foo = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(foo)
+    spec = importlib.util.spec_from_loader(
+        module_name, loader=None, origin=source_path
+    )
+    module = importlib.util.module_from_spec(spec)
+    module.__file__ = source_path
+    # Register the module so that custom scorers can be pickled (to be sent
+    # to worker processes)
+    sys.modules[module_name] = module
+    try:
+        exec(compile(source, source_path, "exec"), module.__dict__)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def read_custom_scorers_source(source_path):
+    source_path = os.path.abspath(source_path)
+    for module_name, (path, _) in custom_sources.items():
+        if path == source_path:
+            return sys.modules[module_name]
+    with open(source_path, "r") as f:
+        source = f.read()
+    module_name = f"teapot_custom_scorers_{len(custom_sources)}"
+    module = _load_source(module_name, source_path, source)
+    custom_sources[module_name] = (source_path, source)
+    return module
+
+
+def load_custom_sources(sources):
+    """Load custom scorers sources under the given module names, unless
+    they are already loaded (this is used to make custom scorers available
+    in worker processes). The source code is passed along with the path so
+    that workers don't depend on the file still being there"""
+    for module_name, (source_path, source) in sources.items():
+        if module_name not in sys.modules:
+            _load_source(module_name, source_path, source)
+            custom_sources[module_name] = (source_path, source)
 
 
 def get_scorer_class(key):
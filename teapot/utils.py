@@ -1,5 +1,20 @@
 import sys
+import heapq
 from math import sqrt
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Containers for per-line scores:
+#  - list: python list of floats
+#  - array: array.array("d") (8 bytes per score, no dependency)
+#  - float64/float32: numpy arrays (8/4 bytes per score, requires numpy)
+SCORE_TYPES = ["list", "array", "float64", "float32"]
+# Number of scores processed at once by `stats`
+_CHUNK_SIZE = 1 << 14
 
 
 def itertxt(filename):
@@ -18,23 +33,149 @@ def savetxt(filename, txt):
             print(line, file=f)
 
 
+def as_scores(x, score_type="array"):
+    """Convert a sequence of scores to the given container type"""
+    if score_type not in SCORE_TYPES:
+        raise ValueError(
+            f"Unknown score type \"{score_type}\" "
+            f"(choose from: {', '.join(SCORE_TYPES)})"
+        )
+    if score_type in ["float64", "float32"]:
+        if np is None:
+            raise ValueError(f"Score type {score_type} requires numpy")
+        if isinstance(x, array):
+            x = np.frombuffer(x, dtype=np.float64)
+        return np.asarray(x, dtype=score_type)
+    if np is not None and isinstance(x, np.ndarray):
+        if score_type == "list":
+            return x.tolist()
+        values = array("d")
+        values.frombytes(x.astype(np.float64).tobytes())
+        return values
+    if score_type == "list":
+        return list(x)
+    return x if isinstance(x, array) else array("d", x)
+
+
+def little_endian(values):
+    """Convert an array("d") from native to little endian byte order (or
+    back). This returns the same array on little endian machines and a
+    swapped copy otherwise."""
+    if sys.byteorder == "big":
+        values = array("d", values)
+        values.byteswap()
+    return values
+
+
+def _as_numpy(x):
+    """View (without copy if possible) a sequence of scores as a numpy
+    array"""
+    if isinstance(x, np.ndarray):
+        return x
+    if isinstance(x, array):
+        return np.frombuffer(x, dtype=np.float64)
+    return np.asarray(x, dtype=np.float64)
+
+
+def mean(x):
+    if np is not None and isinstance(x, np.ndarray):
+        return float(x.mean(dtype=np.float64))
+    return sum(x) / len(x)
+
+
 def stats(x):
     N = len(x)
-    x = sorted(x)
+    if np is not None:
+        x = _as_numpy(x)
+        mean = float(x.mean(dtype=np.float64))
+        # Sum of squared deviations, by chunks to avoid a full size float64
+        # temporary
+        sq_dev = 0.0
+        for start in range(0, N, _CHUNK_SIZE):
+            deviation = x[start:start + _CHUNK_SIZE] - np.float64(mean)
+            sq_dev += float(np.dot(deviation, deviation))
+        std = sqrt(sq_dev / max(N - 1, .1))
+        # Partial sort instead of a full sort
+        k_5, k_95 = int(N * 0.05), int(N * 0.95)
+        partitioned = np.partition(x, [k_5, k_95])
+        return mean, std, float(partitioned[k_5]), float(partitioned[k_95])
     mean = sum(x) / N
-    std = sqrt(sum([(x_i - mean) ** 2 for x_i in x]) / max(N - 1, .1))
-    percentile_5 = x[int(N * 0.05)]
-    percentile_95 = x[int(N * 0.95)]
+    std = sqrt(sum((x_i - mean) ** 2 for x_i in x) / max(N - 1, .1))
+    percentile_5, percentile_95 = _select(x, [int(N * 0.05), int(N * 0.95)])
     return mean, std, percentile_5, percentile_95
 
 
-def relative_decrease(y, x):
+def _select(x, ranks):
+    """Values at the given ranks in sorted order, for each rank. Chunks of
+    `x` are sorted into compact arrays and merged so that the whole sorted
+    sequence is never held as a list"""
+    chunks = [
+        array("d", sorted(x[start:start + _CHUNK_SIZE]))
+        for start in range(0, len(x), _CHUNK_SIZE)
+    ]
+    wanted = set(ranks)
+    values = {}
+    for rank, value in enumerate(heapq.merge(*chunks)):
+        if rank in wanted:
+            values[rank] = value
+            if len(values) == len(wanted):
+                break
+    return [values[rank] for rank in ranks]
+
+
+def _relative_decrease(y, x):
     if y > 0:
         return max(0, y - x) / y
     else:
         return 0
 
 
+def relative_decrease(y, x):
+    """Relative decrease from y to x, clamped to positive values
+
+    This works on single scores or on sequences of scores (in which case
+    the result has the same type as `y`)"""
+    if np is not None and isinstance(y, np.ndarray):
+        x = _as_numpy(x).astype(y.dtype, copy=False)
+        positive = y > 0
+        rd = np.zeros_like(y)
+        rd[positive] = (
+            np.maximum(0, y[positive] - x[positive]) / y[positive]
+        )
+        return rd
+    if isinstance(y, array):
+        return array("d", map(_relative_decrease, y, x))
+    if isinstance(y, list):
+        return list(map(_relative_decrease, y, x))
+    return _relative_decrease(y, x)
+
+
+def attack_success(s_src, d_tgt, threshold=1.0):
+    """1 if s_src + d_tgt > threshold else 0, for each line"""
+    if np is not None and isinstance(s_src, np.ndarray):
+        return (s_src + _as_numpy(d_tgt) > threshold).astype(s_src.dtype)
+    success = (float(s + d > threshold) for s, d in zip(s_src, d_tgt))
+    if isinstance(s_src, array):
+        return array("d", success)
+    return list(success)
+
+
+def refless_attack_success(s_src, s_tgt, threshold=1.0):
+    """1 if s_src / s_tgt > threshold else 0, for each line (reference-less
+    criterion)
+
+    This is computed as s_src > threshold * s_tgt so that s_tgt == 0 is
+    handled the same way for all containers: it counts as a success iff
+    s_src > 0"""
+    if np is not None and isinstance(s_src, np.ndarray):
+        success = s_src > threshold * _as_numpy(s_tgt)
+        return success.astype(s_src.dtype)
+    success = (float(s > threshold * d) for s, d in zip(s_src, s_tgt))
+    if isinstance(s_src, array):
+        return array("d", success)
+    return list(success)
+
+
 def check_tokenization(sents):
     """Check whether an input text is tokenized (borrowed from sacreBLEU)"""
     too_much = 100
@@ -1,10 +1,12 @@
 import os.path
+import json
 import unittest
 
 import sys
 teapot_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
 sys.path.append(teapot_root)
 import teapot  # noqa
+import teapot.scheduling  # noqa
 
 
 class TestAPI(unittest.TestCase):
@@ -23,3 +25,43 @@ class TestAPI(unittest.TestCase):
         teapot.METEOR("path/to/meteor.jar", java_command="java -Xmx2G -jar")
         chrf_scorer.score(self.adv_inputs, self.inputs)
         chrf_scorer.rd_score(self.adv_outputs, self.outputs, self.refs)
+
+    def test_score_compatibility(self):
+        # Scores behave like a read-only sequence of floats
+        chrf_scorer = teapot.ChrF()
+        scores = chrf_scorer.score(self.adv_inputs, self.inputs)
+        self.assertEqual(len(scores), 2)
+        first, second = scores
+        self.assertEqual([first, second], [scores[0], scores[-1]])
+        self.assertEqual([score for score in scores], list(scores))
+        self.assertTrue(all(isinstance(score, float) for score in scores))
+        self.assertAlmostEqual(sum(scores) / len(scores), (first + second) / 2)
+        self.assertEqual(list(scores[:1]), [first])
+        # Use `score_type="list"` to get an actual list
+        scores_list = chrf_scorer.score(
+            self.adv_inputs, self.inputs, score_type="list")
+        self.assertIsInstance(scores_list, list)
+        self.assertEqual(scores_list, list(scores))
+        self.assertEqual(json.loads(json.dumps(scores_list)), scores_list)
+        rd_list = chrf_scorer.rd_score(
+            self.adv_outputs, self.outputs, self.refs, score_type="list")
+        self.assertIsInstance(rd_list, list)
+
+    def test_score_matrix(self):
+        chrf_scorer = teapot.ChrF()
+        corpora = [self.outputs, self.adv_outputs, self.refs]
+        matrix = chrf_scorer.score_matrix(corpora)
+        self.assertEqual(len(matrix), 3)
+        for i in range(3):
+            for j in range(3):
+                self.assertEqual(
+                    matrix[i][j],
+                    chrf_scorer.score(corpora[i], corpora[j]),
+                )
+        upper = chrf_scorer.score_matrix(corpora, symmetric=True)
+        self.assertEqual(upper[0][1], matrix[0][1])
+        self.assertIs(upper[1][0], upper[0][1])
+        # Same scores when all pairs are scheduled at once
+        with teapot.scheduling.Scheduler() as scheduler:
+            scheduled = chrf_scorer.score_matrix(corpora, scheduler=scheduler)
+        self.assertEqual(scheduled, matrix)
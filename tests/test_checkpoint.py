@@ -0,0 +1,129 @@
+import os.path
+import tempfile
+import unittest
+import tracemalloc
+
+import sys
+teapot_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(teapot_root)
+from teapot import scorers  # noqa
+from teapot import checkpoint  # noqa
+
+
+class CountingChrF(scorers.ChrF):
+
+    def __init__(self):
+        self.n_scored = 0
+
+    def score_corpus(self, hyps, refs, lang=None):
+        self.n_scored += len(hyps)
+        return super().score_corpus(hyps, refs, lang=lang)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.refs = [f"the cat number {i} sat on the mat" for i in range(10)]
+        self.hyps = [f"a cat ({i}) sat on a mat" for i in range(10)]
+        self.bases = [f"the cat {i} sits on the mat" for i in range(10)]
+        self.expected = scorers.ChrF().score(self.hyps, self.refs)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "ckpt.bin")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_identical_scores(self):
+        with checkpoint.Checkpoint(self.path, {}, every=3) as ckpt:
+            scores = scorers.ChrF().score(
+                self.hyps, self.refs, checkpoint=ckpt)
+        self.assertEqual(scores, self.expected)
+
+    def test_resume(self):
+        # Simulate an interrupted run
+        with checkpoint.Checkpoint(self.path, {}, every=3) as ckpt:
+            scorers.ChrF().score(self.hyps[:7], self.refs[:7], checkpoint=ckpt)
+        # Add a partially written record at the end
+        with open(self.path, "ab") as f:
+            f.write(b"\x05\x00s")
+        scorer = CountingChrF()
+        ckpt = checkpoint.Checkpoint(self.path, {}, every=3, resume=True)
+        with ckpt:
+            scores = scorer.score(self.hyps, self.refs, checkpoint=ckpt)
+        self.assertEqual(scores, self.expected)
+        # Only the lines that were not checkpointed are scored again
+        self.assertEqual(scorer.n_scored, 10 - 7)
+        # Everything is done now
+        scorer = CountingChrF()
+        with checkpoint.Checkpoint(self.path, {}, resume=True) as ckpt:
+            scores = scorer.score(self.hyps, self.refs, checkpoint=ckpt)
+        self.assertEqual(scores, self.expected)
+        self.assertEqual(scorer.n_scored, 0)
+
+    def test_resume_rd_score(self):
+        expected = scorers.ChrF().rd_score(self.hyps, self.bases, self.refs)
+        with checkpoint.Checkpoint(self.path, {}, every=4) as ckpt:
+            scorers.ChrF().score(
+                self.bases, self.refs, checkpoint=ckpt, key="d_tgt/base")
+        ckpt = checkpoint.Checkpoint(self.path, {}, every=4, resume=True)
+        with ckpt:
+            rd_scores = scorers.ChrF().rd_score(
+                self.hyps, self.bases, self.refs, checkpoint=ckpt, key="d_tgt")
+        self.assertEqual(rd_scores, expected)
+
+    def test_fingerprint_mismatch(self):
+        with checkpoint.Checkpoint(self.path, {"s_src": "chrf"}):
+            pass
+        with self.assertRaises(ValueError):
+            checkpoint.Checkpoint(self.path, {"s_src": "bleu"}, resume=True)
+
+    def test_no_overwrite(self):
+        with checkpoint.Checkpoint(self.path, {}, every=3) as ckpt:
+            scorers.ChrF().score(self.hyps, self.refs, checkpoint=ckpt)
+        with self.assertRaises(ValueError):
+            checkpoint.Checkpoint(self.path, {})
+        # The saved scores are still there
+        with checkpoint.Checkpoint(self.path, {}, resume=True) as ckpt:
+            self.assertEqual(len(ckpt.load("score")), 10)
+        with checkpoint.Checkpoint(self.path, {}, overwrite=True) as ckpt:
+            self.assertEqual(len(ckpt.load("score")), 0)
+
+    def test_truncated_header(self):
+        with checkpoint.Checkpoint(self.path, {"s_src": "chrf"}):
+            pass
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for length in [10, len(data) - 2]:
+            with open(self.path, "wb") as f:
+                f.write(data[:length])
+            with self.assertRaisesRegex(ValueError, "not a TEAPOT"):
+                checkpoint.Checkpoint(
+                    self.path, {"s_src": "chrf"}, resume=True)
+
+    def test_load(self):
+        with checkpoint.Checkpoint(self.path, {}, every=3) as ckpt:
+            scorers.ChrF().score(self.hyps, self.refs, checkpoint=ckpt)
+            scorers.ChrF().score(
+                self.bases, self.refs, checkpoint=ckpt, key="base")
+            # Scores are read back from the file
+            self.assertEqual(ckpt.load("score"), self.expected)
+            self.assertEqual(len(ckpt.load("base")), 10)
+            self.assertEqual(len(ckpt.load("other")), 0)
+
+    def test_memory(self):
+        N = 100000
+        hyps = ["a cat"] * N
+        scorer = scorers.ZeroOne()
+        tracemalloc.start()
+        try:
+            with checkpoint.Checkpoint(self.path, {}) as ckpt:
+                scores = scorer.score(hyps, hyps, checkpoint=ckpt)
+                retained = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(scores), N)
+        # Only the returned scores are kept in memory (8 bytes per line)
+        self.assertLess(retained / N, 12)
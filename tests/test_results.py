@@ -0,0 +1,91 @@
+import os.path
+import random
+import tempfile
+import unittest
+
+import sys
+teapot_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(teapot_root)
+from teapot import results  # noqa
+from teapot import utils  # noqa
+
+
+class TestResults(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        rng = random.Random(0)
+        self.s_src = [rng.random() for _ in range(1000)]
+        self.d_tgt = [rng.random() for _ in range(1000)]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "results.bin")
+        results.save_results(
+            self.path,
+            {"s_src": self.s_src, "d_tgt": self.d_tgt},
+            top_k=10,
+            n_bins=5,
+        )
+        self.results = results.Results(self.path)
+
+    @classmethod
+    def tearDownClass(self):
+        self.tmp_dir.cleanup()
+
+    def test_index_options(self):
+        path = os.path.join(self.tmp_dir.name, "invalid.bin")
+        for top_k, n_bins in [(10, 0), (10, -3), (-1, 5)]:
+            with self.assertRaises(ValueError):
+                results.save_results(
+                    path, {"s_src": self.s_src}, top_k=top_k, n_bins=n_bins)
+            with self.assertRaises(ValueError):
+                results.build_index(self.s_src, top_k=top_k, n_bins=n_bins)
+        self.assertFalse(os.path.exists(path))
+
+    def test_columns(self):
+        self.assertEqual(self.results.n_lines, 1000)
+        self.assertEqual(self.results.columns, ["s_src", "d_tgt"])
+        self.assertEqual(
+            [score for _, score in self.results.iter_column("d_tgt")],
+            self.d_tgt,
+        )
+        with self.assertRaises(ValueError):
+            self.results.top_k("s_tgt", 1)
+        with self.assertRaises(ValueError):
+            self.results.top_k("d_tgt", -1)
+
+    def test_top_k(self):
+        ranked = sorted(enumerate(self.d_tgt), key=lambda x: -x[1])
+        # From the index
+        self.assertEqual(self.results.top_k("d_tgt", 5), ranked[:5])
+        # Beyond the index
+        self.assertEqual(self.results.top_k("d_tgt", 50), ranked[:50])
+        self.assertEqual(
+            self.results.top_k("d_tgt", 50, largest=False),
+            ranked[::-1][:50],
+        )
+
+    def test_threshold(self):
+        selected = list(self.results.threshold("s_src", above=0.9))
+        self.assertEqual(
+            selected,
+            [(idx, s) for idx, s in enumerate(self.s_src) if s > 0.9],
+        )
+
+    def test_histogram(self):
+        hist = self.results.histogram("s_src")
+        self.assertEqual(len(hist["counts"]), 5)
+        self.assertEqual(len(hist["edges"]), 6)
+        self.assertEqual(sum(hist["counts"]), 1000)
+
+    def test_select_lines(self):
+        filename = os.path.join(self.tmp_dir.name, "text.txt")
+        utils.savetxt(filename, [f"line {i}" for i in range(20)])
+        self.assertEqual(
+            results.select_lines(filename, [3, 12]),
+            {3: "line 3", 12: "line 12"},
+        )
+        # The file was modified
+        with self.assertRaises(ValueError):
+            results.select_lines(filename, [3, 25])
+        with self.assertRaises(ValueError):
+            results.select_lines(filename + ".moved", [3])
@@ -0,0 +1,158 @@
+import os.path
+import time
+import multiprocessing
+import tempfile
+import textwrap
+import unittest
+
+import sys
+teapot_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(teapot_root)
+from teapot import scorers  # noqa
+from teapot import scheduling  # noqa
+
+
+class SlowScorer(scorers.Scorer):
+    """Takes time proportional to the length of the inputs and records the
+    size of each batch"""
+    _name = "slow"
+    thread_safe = True
+    pure = True
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def score_corpus(self, hyps, refs, lang=None):
+        self.batch_sizes.append(len(hyps))
+        return super().score_corpus(hyps, refs, lang=lang)
+
+    def score_sentence(self, hyp, ref, lang=None):
+        time.sleep(1e-5 * self.cost(hyp, ref))
+        return float(hyp == ref)
+
+
+class UnpicklableChrF(scorers.ChrF):
+
+    def __init__(self):
+        self.model = lambda x: x
+
+
+class TestScheduler(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.refs = [f"the cat number {i} sat on the mat" for i in range(50)]
+        self.hyps = [f"a cat ({i % 7}) sat on a mat" for i in range(50)]
+        self.expected = scorers.ChrF().score(self.hyps, self.refs)
+
+    def test_backend_selection(self):
+        scheduler = scheduling.Scheduler(workers=4)
+        self.assertEqual(scheduler.backend_for(scorers.ChrF()), "process")
+        self.assertEqual(scheduler.backend_for(scorers.METEOR("")), "thread")
+        self.assertEqual(scheduler.backend_for(SlowScorer()), "thread")
+        self.assertEqual(scheduler.backend_for(scorers.Scorer()), "serial")
+        scheduler = scheduling.Scheduler(workers=1)
+        self.assertEqual(scheduler.backend_for(scorers.ChrF()), "serial")
+        scheduler = scheduling.Scheduler(workers=2, backend="process")
+        with self.assertRaises(ValueError):
+            scheduler.backend_for(SlowScorer())
+
+    def test_same_scores(self):
+        for backend in ["serial", "thread", "process"]:
+            with scheduling.Scheduler(workers=3, backend=backend) as sched:
+                scores = scorers.ChrF().score(
+                    self.hyps, self.refs, scheduler=sched)
+            self.assertEqual(scores, self.expected)
+
+    def test_adaptive_batch_size(self):
+        scorer = SlowScorer()
+        scorer.batch_size = 2
+        scheduler = scheduling.Scheduler(batch_seconds=0.01)
+        scorer.score(["a cat"] * 200, ["the cat"] * 200, scheduler=scheduler)
+        # The first batch follows the scorer's hint, then the size is
+        # adapted to the measured throughput
+        self.assertEqual(scorer.batch_sizes[0], 2)
+        self.assertGreater(max(scorer.batch_sizes[1:]), 2)
+        self.assertEqual(sum(scorer.batch_sizes), 200)
+
+    def test_batch_size_bounds(self):
+        scorer = SlowScorer()
+        scorer.batch_size = 100
+        scorer.min_batch_size = 5
+        scorer.max_batch_size = 10
+        scorer.score(self.hyps, self.refs, scheduler=scheduling.Scheduler())
+        self.assertTrue(all(5 <= size <= 10 for size in scorer.batch_sizes))
+
+    def test_deduplicate(self):
+        refs = ["a cat sat on a mat"] * len(self.hyps)
+        scorer = SlowScorer()
+        scheduler = scheduling.Scheduler(deduplicate=True)
+        scores = scorer.score(self.hyps, refs, scheduler=scheduler)
+        # There are only 7 unique pairs
+        self.assertEqual(sum(scorer.batch_sizes), 7)
+        self.assertEqual(scores, SlowScorer().score(self.hyps, refs))
+
+    def test_balanced_batches(self):
+        # One very long sentence and many short ones
+        hyps = ["a" * 1000] + ["a"] * 99
+        refs = ["b"] * 100
+        scorer = SlowScorer()
+        scorer.batch_size = 10
+        scorer.score(hyps, refs, scheduler=scheduling.Scheduler())
+        # Batches are budgeted by cost: the long sentence is scored on its
+        # own, the next batch contains many short sentences
+        self.assertEqual(scorer.batch_sizes[0], 1)
+        self.assertGreater(scorer.batch_sizes[1], 10)
+
+    def test_custom_scorer_processes(self):
+        source = textwrap.dedent("""
+            import teapot
+
+            @teapot.register_scorer("test_process_f1", "F-1")
+            class ProcessF1(teapot.Scorer):
+                process_safe = True
+
+                def score_sentence(self, hyp, ref, lang=None):
+                    return float(len(set(hyp.split()) & set(ref.split())))
+
+            class Unpicklable(ProcessF1):
+
+                def __init__(self):
+                    self.model = lambda x: x
+        """)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "custom.py")
+            with open(path, "w") as f:
+                f.write(source)
+            module = scorers.read_custom_scorers_source(path)
+            scorer = scorers.get_scorer_class("test_process_f1")()
+            expected = scorer.score(self.hyps, self.refs)
+            # With spawn (or forkserver) workers don't inherit the loaded
+            # modules and need to load the source file again
+            with scheduling.Scheduler(
+                workers=2,
+                backend="process",
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as sched:
+                scores = scorer.score(self.hyps, self.refs, scheduler=sched)
+        self.assertEqual(scores, expected)
+        # Scorers that can't be pickled are not run in other processes
+        sched = scheduling.Scheduler(workers=2)
+        self.assertEqual(sched.backend_for(scorer), "process")
+        self.assertEqual(sched.backend_for(module.Unpicklable()), "serial")
+
+    def test_scorer_caches(self):
+        # Cached properties are not shared by scorers that happen to get
+        # the same id once the previous one is freed
+        scheduler = scheduling.Scheduler(workers=2)
+        for _ in range(10):
+            scorer = scorers.ChrF()
+            self.assertEqual(scheduler.backend_for(scorer), "process")
+            scheduler._update(scorer, 1, 1.0)
+            del scorer
+            scorer = UnpicklableChrF()
+            self.assertEqual(scheduler.backend_for(scorer), "thread")
+            self.assertIsNone(scheduler._seconds_per_cost.get(scorer))
+            del scorer
+        self.assertEqual(len(scheduler._picklable), 0)
+        self.assertEqual(len(scheduler._seconds_per_cost), 0)
@@ -0,0 +1,114 @@
+import os.path
+import random
+import unittest
+import tracemalloc
+from array import array
+
+import sys
+teapot_root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.append(teapot_root)
+from teapot import utils  # noqa
+
+
+class TestScoreTypes(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        # These are exactly representable in float32
+        self.base = [0.5, 0.0, 0.75, 0.25]
+        self.hyp = [0.25, 0.375, 0.875, 0.0]
+        self.rd = [0.5, 0.0, 0.0, 1.0]
+
+    def score_types(self):
+        if utils.np is None:
+            return ["list", "array"]
+        return utils.SCORE_TYPES
+
+    def test_as_scores(self):
+        self.assertIsInstance(utils.as_scores(self.base), array)
+        for score_type in self.score_types():
+            scores = utils.as_scores(self.base, score_type)
+            self.assertEqual(len(scores), 4)
+            self.assertEqual(list(utils.as_scores(scores, "list")), self.base)
+        with self.assertRaises(ValueError):
+            utils.as_scores(self.base, "float16")
+
+    def test_relative_decrease(self):
+        self.assertAlmostEqual(utils.relative_decrease(0.5, 0.25), 0.5)
+        self.assertAlmostEqual(utils.relative_decrease(0.0, 0.25), 0)
+        for score_type in self.score_types():
+            rd = utils.relative_decrease(
+                utils.as_scores(self.base, score_type),
+                utils.as_scores(self.hyp, score_type),
+            )
+            self.assertEqual(type(rd), type(utils.as_scores([], score_type)))
+            for value, expected in zip(rd, self.rd):
+                self.assertAlmostEqual(value, expected)
+
+    def test_attack_success(self):
+        for score_type in self.score_types():
+            success = utils.attack_success(
+                utils.as_scores(self.base, score_type),
+                utils.as_scores(self.hyp, score_type),
+                threshold=1.0,
+            )
+            self.assertEqual(list(success), [0, 0, 1, 0])
+            success = utils.refless_attack_success(
+                utils.as_scores(self.hyp, score_type),
+                utils.as_scores(self.base[:1] * 4, score_type),
+            )
+            self.assertEqual(list(success), [0, 0, 1, 0])
+
+    def test_refless_zero_denominator(self):
+        # Same result for all containers (no division by zero)
+        for score_type in self.score_types():
+            success = utils.refless_attack_success(
+                utils.as_scores([0.5, 0.0, 0.5], score_type),
+                utils.as_scores([0.0, 0.0, 0.25], score_type),
+            )
+            self.assertEqual(list(success), [1, 0, 1])
+
+    def test_stats(self):
+        x = [float(i) for i in range(101)]
+        expected = utils.stats(x)
+        self.assertAlmostEqual(expected[0], 50)
+        self.assertEqual(expected[2:], (5, 95))
+        for score_type in self.score_types():
+            for value, expected_value in zip(
+                utils.stats(utils.as_scores(x, score_type)),
+                expected,
+            ):
+                self.assertAlmostEqual(value, expected_value, places=4)
+
+    def test_stats_chunks(self):
+        x = [float(i % 7) for i in range(1000)]
+        expected = utils.stats(x)
+        chunk_size = utils._CHUNK_SIZE
+        utils._CHUNK_SIZE = 64
+        try:
+            for score_type in self.score_types():
+                for value, expected_value in zip(
+                    utils.stats(utils.as_scores(x, score_type)),
+                    expected,
+                ):
+                    self.assertAlmostEqual(value, expected_value, places=4)
+        finally:
+            utils._CHUNK_SIZE = chunk_size
+
+    def test_stats_memory_without_numpy(self):
+        N = 200000
+        x = array("d", (random.random() for _ in range(N)))
+        expected = sorted(x)
+        np = utils.np
+        utils.np = None
+        try:
+            tracemalloc.start()
+            _, _, percentile_5, percentile_95 = utils.stats(x)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            utils.np = np
+        self.assertEqual(percentile_5, expected[int(N * 0.05)])
+        self.assertEqual(percentile_95, expected[int(N * 0.95)])
+        # A sorted list of floats would take ~32 bytes per line
+        self.assertLess(peak / N, 16)